@@ -0,0 +1,97 @@
+import threading
+from contextlib import contextmanager
+
+from PIL import Image
+
+
+class AdmissionRejected(Exception):
+    """Solicitud rechazada por saturación del servidor"""
+
+    def __init__(self, message, status_code, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionController():
+    """Limita inferencias concurrentes e imágenes en cola antes de llamar al modelo"""
+
+    def __init__(self, max_concurrent=2, max_queued_images=30,
+                 wait_timeout=10, retry_after=5):
+        self.max_concurrent = max_concurrent
+        self.max_queued_images = max_queued_images
+        self.wait_timeout = wait_timeout
+        self.retry_after = retry_after
+
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._queued_images = 0
+        self._waiting = 0
+        self._running = 0
+        self._admitted = 0
+        self._rejected_queue_full = 0
+        self._rejected_timeout = 0
+
+    @contextmanager
+    def acquire(self, num_images):
+        # Reserva de cupo en la cola (rechazo inmediato si no hay espacio)
+        with self._lock:
+            if self._queued_images + num_images > self.max_queued_images:
+                self._rejected_queue_full += 1
+                raise AdmissionRejected(
+                    "Servidor ocupado: demasiadas imágenes en cola.",
+                    429, self.retry_after)
+            self._queued_images += num_images
+            self._waiting += 1
+
+        # Espera acotada por un turno de inferencia
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            with self._lock:
+                self._queued_images -= num_images
+                self._waiting -= 1
+                self._rejected_timeout += 1
+            raise AdmissionRejected(
+                "Servidor saturado: tiempo de espera agotado.",
+                503, self.retry_after)
+
+        with self._lock:
+            self._waiting -= 1
+            self._running += 1
+            self._admitted += 1
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._queued_images -= num_images
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queued_images': self.max_queued_images,
+                'running': self._running,
+                'waiting': self._waiting,
+                'queued_images': self._queued_images,
+                'admitted': self._admitted,
+                'rejected_queue_full': self._rejected_queue_full,
+                'rejected_timeout': self._rejected_timeout,
+            }
+
+
+def image_size(file):
+    """Lee solo la cabecera de la imagen para obtener (ancho, alto), sin decodificar"""
+    stream = file.stream
+    position = stream.tell()
+    try:
+        with Image.open(stream) as img:
+            return img.size
+    finally:
+        stream.seek(position)
+
+
+def image_pixels(file):
+    width, height = image_size(file)
+    return width * height
@@ -1,4 +1,5 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Response, stream_with_context
 from flask_mysqldb import MySQL
 from flask_wtf.csrf import CSRFProtect
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
@@ -6,11 +7,17 @@ from flask import send_from_directory
 from werkzeug.utils import secure_filename
 from functools import wraps
 import keras  
-from tensorflow.keras.preprocessing import image
 import numpy as np
 import os
+import io
+import csv
+import click
 from collections import Counter
+from PIL import Image
 from config import config
+from admision import AdmissionController, AdmissionRejected, image_pixels, image_size
+from preprocesamiento import BatchBufferPool, preprocess_into
+from perfilado import RequestProfiler
 from models.ModelUser import ModelUser
 from models.entities.User import User
 
@@ -53,11 +60,36 @@ login_manager_app.login_view = 'login'
 UPLOAD_FOLDER = os.path.join(SRC_DIR, 'static', 'uploads')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_IMAGES'] = 10
+app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024
+app.config['MAX_IMAGE_PIXELS'] = 40_000_000
+app.config['MAX_CONCURRENT_INFERENCES'] = 2
+app.config['MAX_QUEUED_IMAGES'] = 30
+app.config['ADMISSION_TIMEOUT'] = 10
+app.config['RETRY_AFTER'] = 5
+app.config['PROFILE_FOLDER'] = os.path.join(BASE_DIR, 'perfiles')
+app.config['PROFILE_MAX_CAPTURES'] = 20
 
 MODEL_PATH = os.path.join(BASE_DIR, 'modelo_plagas_palta.keras')  
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+admission = AdmissionController(
+    max_concurrent=app.config['MAX_CONCURRENT_INFERENCES'],
+    max_queued_images=app.config['MAX_QUEUED_IMAGES'],
+    wait_timeout=app.config['ADMISSION_TIMEOUT'],
+    retry_after=app.config['RETRY_AFTER']
+)
+
+buffer_pool = BatchBufferPool(
+    app.config['MAX_CONCURRENT_INFERENCES'],
+    app.config['MAX_IMAGES']
+)
+
+profiler = RequestProfiler(
+    app.config['PROFILE_FOLDER'],
+    max_captures=app.config['PROFILE_MAX_CAPTURES']
+)
+
 if os.path.exists(MODEL_PATH):
     model = keras.models.load_model(MODEL_PATH)  
     print(f" Modelo cargado desde: {MODEL_PATH}")
@@ -207,39 +239,44 @@ def procesar_multiples_imagenes(files):
     """Procesa múltiples imágenes y genera resultado por votacion"""
     resultados = []
     filenames = []
+    validas = []
+    
+    # Buffer float32 del pool: cada imagen se normaliza en su fila
+    with buffer_pool.checkout() as batch:
+        for file in files:
+            try:
+                filename_safe = secure_filename(file.filename)
+                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename_safe)
+                file.save(filepath)
+                filenames.append(filename_safe)
+                
+                preprocess_into(filepath, batch[len(validas)])
+                validas.append(filename_safe)
+                
+            except Exception as e:
+                print(f" Error en {file.filename}: {e}")
+                continue
+        
+        if not validas:
+            return None
+        
+        with profiler.trace_predict():
+            predictions = model.predict(batch[:len(validas)], verbose=0)
     
-    for file in files:
-        try:
-            filename_safe = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename_safe)
-            file.save(filepath)
-            filenames.append(filename_safe)
-            
-            img = image.load_img(filepath, target_size=(224, 224))
-            img_array = image.img_to_array(img) / 255.0
-            img_array = np.expand_dims(img_array, axis=0)
-            
-            predictions = model.predict(img_array, verbose=0)
-            predicted_index = np.argmax(predictions[0])
-            predicted_class = class_names[predicted_index]
-            probability = float(np.max(predictions[0])) * 100
-            
-            resultados.append({
-                'filename': filename_safe,
-                'class': predicted_class,
-                'probability': probability,
-                'index': predicted_index,
-                'all_probabilities': predictions[0].tolist()
-            })
-            
-            print(f" {filename_safe}: {predicted_class} ({probability:.2f}%)")
-            
-        except Exception as e:
-            print(f" Error en {file.filename}: {e}")
-            continue
-    
-    if not resultados:
-        return None
+    for filename_safe, prediction in zip(validas, predictions):
+        predicted_index = np.argmax(prediction)
+        predicted_class = class_names[predicted_index]
+        probability = float(np.max(prediction)) * 100
+        
+        resultados.append({
+            'filename': filename_safe,
+            'class': predicted_class,
+            'probability': probability,
+            'index': predicted_index,
+            'all_probabilities': prediction.tolist()
+        })
+        
+        print(f" {filename_safe}: {predicted_class} ({probability:.2f}%)")
     
     return calcular_consenso_por_votacion(resultados, filenames)
 
@@ -325,6 +362,122 @@ def calcular_consenso_por_votacion(resultados, filenames):
     }
 
 
+# --------------------------------------------
+# IMPORTACION / EXPORTACION MASIVA DE USUARIOS
+# --------------------------------------------
+CSV_USER_FIELDS = ['username', 'password', 'fullname', 'role']
+VALID_ROLES = ('usuario', 'administrador')
+
+
+def importar_usuarios_csv(text_stream):
+    """Valida un CSV de usuarios y crea las filas validas en una sola transaccion"""
+    reader = csv.DictReader(text_stream)
+    
+    faltantes = {'username', 'password'} - set(reader.fieldnames or [])
+    if faltantes:
+        raise ValueError(f"Columnas obligatorias faltantes: {', '.join(sorted(faltantes))}")
+    
+    errores = []
+    candidatos = []
+    vistos = set()
+    
+    # La fila 1 es la cabecera
+    for num_fila, fila in enumerate(reader, start=2):
+        username = (fila.get('username') or '').strip()
+        password = fila.get('password') or ''
+        fullname = (fila.get('fullname') or '').strip()
+        role = (fila.get('role') or '').strip() or 'usuario'
+        
+        # MySQL compara usuarios sin distinguir mayúsculas
+        clave = username.casefold()
+        
+        if not username or not password.strip():
+            error = "Usuario y contraseña son obligatorios"
+        elif len(password) < 6:
+            error = "La contraseña debe tener al menos 6 caracteres"
+        elif role not in VALID_ROLES:
+            error = f"Rol inválido '{role}'"
+        elif clave in vistos:
+            error = "Usuario duplicado en el archivo"
+        else:
+            error = None
+        
+        if error:
+            errores.append({'fila': num_fila, 'username': username, 'error': error})
+            continue
+        
+        vistos.add(clave)
+        candidatos.append((num_fila, User(0, username, None, fullname, role), password))
+    
+    # Una sola consulta para todos los duplicados contra la base de datos
+    existentes = {
+        u.casefold()
+        for u in ModelUser.existing_usernames(db, [u.username for _, u, _ in candidatos])
+    }
+    
+    nuevos = []
+    for num_fila, usuario, password in candidatos:
+        if usuario.username.casefold() in existentes:
+            errores.append({'fila': num_fila, 'username': usuario.username,
+                            'error': "El usuario ya existe"})
+        else:
+            nuevos.append((usuario, password))
+    
+    creados = 0
+    if nuevos:
+        creados = ModelUser.bulk_create(db, [u for u, _ in nuevos], [p for _, p in nuevos])
+    
+    errores.sort(key=lambda e: e['fila'])
+    return creados, errores
+
+
+def celda_csv_segura(valor):
+    """Evita que Excel interprete como fórmula un valor que empieza con =, +, -, @, tab o CR"""
+    valor = '' if valor is None else str(valor)
+    if valor.startswith(('=', '+', '-', '@', '\t', '\r')):
+        return "'" + valor
+    return valor
+
+
+def exportar_usuarios_csv():
+    """Genera el CSV de usuarios por partes, sin cargar toda la tabla en memoria"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    
+    writer.writerow(['id', 'username', 'fullname', 'role'])
+    for usuario in ModelUser.iter_all(db):
+        writer.writerow([usuario.id, celda_csv_segura(usuario.username),
+                         celda_csv_segura(usuario.fullname), celda_csv_segura(usuario.role)])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    
+    yield buffer.getvalue()
+
+
+def metadatos_de_perfil(files):
+    """Datos de la solicitud que acompañan a cada perfil capturado"""
+    imagenes = []
+    for file in files:
+        stream = file.stream
+        stream.seek(0, os.SEEK_END)
+        info = {'filename': file.filename, 'bytes': stream.tell()}
+        stream.seek(0)
+        try:
+            info['width'], info['height'] = image_size(file)
+        except Exception:
+            pass
+        imagenes.append(info)
+    
+    return {
+        'user_id': current_user.id,
+        'username': current_user.username,
+        'path': request.path,
+        'num_images': len(files),
+        'images': imagenes
+    }
+
+
 # --------------------------------------------
 # RUTA PRINCIPAL
 # --------------------------------------------
@@ -350,8 +503,27 @@ def home():
             flash(f" Máximo {app.config['MAX_IMAGES']} imágenes permitidas.")
             return redirect(url_for('home'))
         
+        # Validar dimensiones leyendo solo la cabecera (antes de decodificar)
+        for file in files:
+            try:
+                pixels = image_pixels(file)
+            except Image.DecompressionBombError:
+                # Pillow rechaza la cabecera de imágenes enormes (> 2x Image.MAX_IMAGE_PIXELS)
+                pixels = None
+            except Exception:
+                flash(f" '{file.filename}' no es una imagen válida.")
+                return redirect(url_for('home'))
+            
+            if pixels is None or pixels > app.config['MAX_IMAGE_PIXELS']:
+                flash(f" '{file.filename}' excede el máximo de "
+                      f"{app.config['MAX_IMAGE_PIXELS'] // 1_000_000} megapíxeles.")
+                return redirect(url_for('home'))
+        
         try:
-            resultado = procesar_multiples_imagenes(files)
+            # El perfil empieza con el turno ya concedido: no mide la espera ni los rechazos
+            with admission.acquire(len(files)):
+                with profiler.capture(lambda: metadatos_de_perfil(files)):
+                    resultado = procesar_multiples_imagenes(files)
             
             if resultado is None:
                 flash(" Error al procesar las imágenes.")
@@ -374,6 +546,13 @@ def home():
                 recommendations=additional_recommendations.get(resultado['predicted_class'], "")
             )
             
+        except AdmissionRejected as e:
+            print(f" RECHAZADO ({e.status_code}): {e} {admission.stats()}")
+            flash(f" {e} Intenta nuevamente en {e.retry_after} segundos.")
+            return (render_template('home.html', current_user=current_user),
+                    e.status_code,
+                    {'Retry-After': str(e.retry_after)})
+            
         except Exception as e:
             print(f" ERROR: {str(e)}")
             import traceback
@@ -390,6 +569,36 @@ def uploaded_file(filename):
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
 
+@app.route('/admision/estado')
+@login_required
+@admin_required
+def admision_estado():
+    return jsonify(admission.stats())
+
+
+@app.route('/admin/perfilado', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def admin_perfilado():
+    if request.method == 'POST':
+        if request.form.get('accion') == 'desactivar':
+            profiler.disable()
+            flash("Perfilado desactivado", "success")
+        else:
+            try:
+                proximas = int(request.form.get('proximas') or 0)
+                umbral_ms = float(request.form.get('umbral_ms') or 0)
+            except ValueError:
+                flash("Valores inválidos", "warning")
+                return redirect(url_for('admin_perfilado'))
+            
+            profiler.configure(proximas, umbral_ms)
+            flash("Perfilado actualizado", "success")
+        return redirect(url_for('admin_perfilado'))
+    
+    return render_template('admin/perfilado.html', estado=profiler.status())
+
+
 @app.route('/usuarios')
 @login_required
 @admin_required  
@@ -442,6 +651,43 @@ def usuario_nuevo():
     return render_template('usuarios/form.html', usuario=None, accion='Crear')
 
 
+@app.route('/usuarios/importar', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def usuarios_importar():
+    
+    if request.method == 'POST':
+        archivo = request.files.get('archivo')
+        
+        if not archivo or archivo.filename == '':
+            flash("Selecciona un archivo CSV", "warning")
+            return redirect(url_for('usuarios_importar'))
+        
+        try:
+            text_stream = io.TextIOWrapper(archivo.stream, encoding='utf-8-sig', newline='')
+            creados, errores = importar_usuarios_csv(text_stream)
+        except Exception as ex:
+            flash(f"Error al importar: {str(ex)}", "danger")
+            return redirect(url_for('usuarios_importar'))
+        
+        flash(f"{creados} usuario(s) creados, {len(errores)} fila(s) con errores",
+              "success" if not errores else "warning")
+        return render_template('usuarios/importar.html', creados=creados, errores=errores)
+    
+    return render_template('usuarios/importar.html', creados=None, errores=[])
+
+
+@app.route('/usuarios/exportar')
+@login_required
+@admin_required
+def usuarios_exportar():
+    return Response(
+        stream_with_context(exportar_usuarios_csv()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=usuarios.csv'}
+    )
+
+
 @app.route('/usuarios/editar/<int:id>', methods=['GET', 'POST'])
 @login_required
 @admin_required   
@@ -535,18 +781,55 @@ def usuario_eliminar(id):
     return redirect(url_for('usuarios'))
 
 
+# --------------------------------------------
+# COMANDOS CLI
+# --------------------------------------------
+@app.cli.command('importar-usuarios')
+@click.argument('ruta', type=click.Path(exists=True, dir_okay=False))
+@click.option('--config', 'config_name', default='development', type=click.Choice(list(config)))
+def importar_usuarios_command(ruta, config_name):
+    """Importa usuarios desde un CSV (username,password,fullname,role)"""
+    app.config.from_object(config[config_name])
+    
+    with open(ruta, encoding='utf-8-sig', newline='') as f:
+        creados, errores = importar_usuarios_csv(f)
+    
+    for error in errores:
+        click.echo(f"Fila {error['fila']} ({error['username']}): {error['error']}", err=True)
+    click.echo(f"{creados} usuario(s) creados, {len(errores)} fila(s) con errores")
+
+
+@app.cli.command('exportar-usuarios')
+@click.argument('ruta', type=click.Path(dir_okay=False, writable=True))
+@click.option('--config', 'config_name', default='development', type=click.Choice(list(config)))
+def exportar_usuarios_command(ruta, config_name):
+    """Exporta todos los usuarios a un CSV"""
+    app.config.from_object(config[config_name])
+    
+    with open(ruta, 'w', encoding='utf-8', newline='') as f:
+        for parte in exportar_usuarios_csv():
+            f.write(parte)
+    click.echo(f"Usuarios exportados a {ruta}")
+
+
 def status_401(error):
     return redirect(url_for('login'))
 
 def status_404(error):
     return "<h1>Página no encontrada</h1>", 404
 
+def status_413(error):
+    flash(f" La carga excede el máximo de "
+          f"{app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)} MB.")
+    return redirect(url_for('home'))
+
 
 if __name__ == '__main__':
     app.config.from_object(config['development'])
     csrf.init_app(app)
     app.register_error_handler(401, status_401)
     app.register_error_handler(404, status_404)
+    app.register_error_handler(413, status_413)
     
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
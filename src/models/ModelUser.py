@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor
+from MySQLdb.cursors import SSCursor
 from .entities.User import User
 
 class ModelUser():
@@ -50,6 +52,25 @@ class ModelUser():
         except Exception as ex:
             raise Exception(ex)
     
+    @classmethod
+    def iter_all(self, db, batch_size=500):
+        # Cursor del lado del servidor: las filas se leen por lotes
+        cursor = db.connection.cursor(SSCursor)
+        try:
+            sql = "SELECT id, username, fullname, role FROM user ORDER BY id"
+            cursor.execute(sql)
+            
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield User(row[0], row[1], None, row[2], row[3])
+        except Exception as ex:
+            raise Exception(ex)
+        finally:
+            cursor.close()
+    
     @classmethod
     def create(self, db, user, password_plain):
         try:
@@ -73,6 +94,28 @@ class ModelUser():
             db.connection.rollback()
             raise Exception(ex)
     
+    @classmethod
+    def bulk_create(self, db, users, passwords_plain, workers=4):
+        try:
+            cursor = db.connection.cursor()
+            
+            # El hash es costoso y libera el GIL: se calcula en paralelo
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                hashed_passwords = list(executor.map(User.hash_password, passwords_plain))
+            
+            sql = """INSERT INTO user (username, password, fullname, role) 
+                     VALUES (%s, %s, %s, %s)"""
+            cursor.executemany(sql, [
+                (user.username, hashed, user.fullname, user.role)
+                for user, hashed in zip(users, hashed_passwords)
+            ])
+            db.connection.commit()
+            
+            return cursor.rowcount
+        except Exception as ex:
+            db.connection.rollback()
+            raise Exception(ex)
+    
     @classmethod
     def update(self, db, user, password_plain=None):
         try:
@@ -127,6 +170,22 @@ class ModelUser():
         except Exception as ex:
             raise Exception(ex)
     
+    @classmethod
+    def existing_usernames(self, db, usernames):
+        try:
+            usernames = list(set(usernames))
+            if not usernames:
+                return set()
+            
+            cursor = db.connection.cursor()
+            placeholders = ", ".join(["%s"] * len(usernames))
+            sql = f"SELECT username FROM user WHERE username IN ({placeholders})"
+            cursor.execute(sql, usernames)
+            
+            return {row[0] for row in cursor.fetchall()}
+        except Exception as ex:
+            raise Exception(ex)
+    
     @classmethod
     def count_admins(self, db):
         try:
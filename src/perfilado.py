@@ -0,0 +1,175 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import shutil
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+
+class RequestProfiler():
+    """Captura perfiles de CPU y trazas de TensorFlow de solicitudes bajo demanda"""
+
+    def __init__(self, output_dir, max_captures=20):
+        self.output_dir = output_dir
+        self.max_captures = max_captures
+
+        # Con active en False, capture() y trace_predict() no hacen nada
+        self.active = False
+        self.remaining = 0
+        self.threshold_ms = None
+
+        self._lock = threading.Lock()
+        self._busy = threading.Lock()
+        self._local = threading.local()
+
+    def configure(self, next_requests=0, threshold_ms=None):
+        with self._lock:
+            self.remaining = max(0, int(next_requests))
+            self.threshold_ms = threshold_ms if threshold_ms and threshold_ms > 0 else None
+            self.active = self.remaining > 0 or self.threshold_ms is not None
+
+    def disable(self):
+        self.configure(0, None)
+
+    def status(self):
+        with self._lock:
+            return {
+                'active': self.active,
+                'remaining': self.remaining,
+                'threshold_ms': self.threshold_ms,
+                'output_dir': self.output_dir,
+                'captures': self._list_captures(),
+            }
+
+    def capture(self, metadata_fn):
+        if not self.active:
+            return nullcontext()
+        return self._capture(metadata_fn)
+
+    def trace_predict(self):
+        capture_dir = getattr(self._local, 'capture_dir', None)
+        if capture_dir is None:
+            return nullcontext()
+        return self._trace(capture_dir)
+
+    def _take_slot(self):
+        # Devuelve True si la solicitud se captura siempre (modo "próximas N")
+        with self._lock:
+            if self.remaining > 0:
+                self.remaining -= 1
+                self.active = self.remaining > 0 or self.threshold_ms is not None
+                return True
+            return False
+
+    @contextmanager
+    def _capture(self, metadata_fn):
+        # cProfile y el profiler de TensorFlow son globales: una captura a la vez
+        if not self._busy.acquire(blocking=False):
+            yield
+            return
+
+        try:
+            forced = self._take_slot()
+            profile = None
+            if forced or self.threshold_ms is not None:
+                profile = self._start_profile()
+
+            if profile is None:
+                yield
+                return
+
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+            capture_dir = os.path.join(self.output_dir, stamp)
+
+            # La traza de TensorFlow solo se toma en "próximas N": en modo umbral
+            # se iniciaría en cada solicitud y su costo inflaría el tiempo medido
+            if forced:
+                self._local.capture_dir = capture_dir
+
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                profile.disable()
+                self._local.capture_dir = None
+
+                threshold_ms = self.threshold_ms
+                if forced or (threshold_ms is not None and elapsed_ms >= threshold_ms):
+                    try:
+                        self._save(capture_dir, profile, metadata_fn, elapsed_ms, forced)
+                        self._rotate()
+                    except Exception as ex:
+                        print(f" Error al guardar el perfil en {capture_dir}: {ex}")
+        finally:
+            self._busy.release()
+
+    def _start_profile(self):
+        try:
+            profile = cProfile.Profile()
+            profile.enable()
+            return profile
+        except Exception as ex:
+            print(f" Perfilado omitido: {ex}")
+            return None
+
+    @contextmanager
+    def _trace(self, capture_dir):
+        tf = None
+        try:
+            import tensorflow as tf
+            os.makedirs(capture_dir, exist_ok=True)
+            tf.profiler.experimental.start(os.path.join(capture_dir, 'tensorflow'))
+        except Exception as ex:
+            print(f" Traza de TensorFlow omitida: {ex}")
+            tf = None
+
+        try:
+            yield
+        finally:
+            if tf is not None:
+                try:
+                    tf.profiler.experimental.stop()
+                except Exception as ex:
+                    print(f" Error al detener la traza de TensorFlow: {ex}")
+
+    def _save(self, capture_dir, profile, metadata_fn, elapsed_ms, forced):
+        os.makedirs(capture_dir, exist_ok=True)
+        profile.dump_stats(os.path.join(capture_dir, 'cpu.prof'))
+
+        resumen = io.StringIO()
+        pstats.Stats(profile, stream=resumen).sort_stats('cumulative').print_stats(40)
+        with open(os.path.join(capture_dir, 'cpu.txt'), 'w', encoding='utf-8') as f:
+            f.write(resumen.getvalue())
+
+        try:
+            metadata = metadata_fn()
+        except Exception as ex:
+            metadata = {'error': str(ex)}
+
+        metadata.update({
+            'elapsed_ms': round(elapsed_ms, 2),
+            'motivo': 'proximas_solicitudes' if forced else 'umbral',
+            'threshold_ms': self.threshold_ms,
+        })
+        with open(os.path.join(capture_dir, 'metadata.json'), 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=2)
+
+        print(f" Perfil guardado en {capture_dir} ({elapsed_ms:.0f} ms)")
+
+    def _list_captures(self):
+        if not os.path.isdir(self.output_dir):
+            return []
+        return sorted(
+            d for d in os.listdir(self.output_dir)
+            if os.path.isdir(os.path.join(self.output_dir, d))
+        )
+
+    def _rotate(self):
+        captures = self._list_captures()
+        for old in captures[:max(0, len(captures) - self.max_captures)]:
+            shutil.rmtree(os.path.join(self.output_dir, old), ignore_errors=True)
@@ -0,0 +1,148 @@
+import queue
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image, ImageOps
+
+TARGET_SIZE = (224, 224)
+
+
+class BatchBufferPool():
+    """Pool de buffers float32 (max_images, alto, ancho, 3) reutilizados entre solicitudes"""
+
+    def __init__(self, size, max_images, target_size=TARGET_SIZE):
+        self.size = size
+        self.shape = (max_images, target_size[1], target_size[0], 3)
+        self._free = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    @contextmanager
+    def checkout(self):
+        # Con el control de admisión no hay más de size usuarios simultáneos; si los hay,
+        # se usa un buffer temporal en lugar de esperar a que se libere uno del pool
+        try:
+            buffer = self._free.get_nowait()
+            del_pool = True
+        except queue.Empty:
+            with self._lock:
+                del_pool = self._created < self.size
+                if del_pool:
+                    self._created += 1
+            buffer = np.empty(self.shape, dtype=np.float32)
+
+        try:
+            yield buffer
+        finally:
+            if del_pool:
+                self._free.put(buffer)
+
+
+def load_image(path, target_size=TARGET_SIZE, resample=Image.NEAREST):
+    """Abre la imagen decodificando JPEG a escala reducida y aplicando la orientación EXIF"""
+    with Image.open(path) as img:
+        # draft() elige la escala JPEG (1/2, 1/4, 1/8) más pequeña que no baje del tamaño pedido.
+        # Si la foto viene rotada en EXIF, el ancho y alto del archivo están intercambiados.
+        orientation = img.getexif().get(0x0112, 1)
+        if orientation in (5, 6, 7, 8):
+            img.draft('RGB', (target_size[1], target_size[0]))
+        else:
+            img.draft('RGB', target_size)
+
+        img = ImageOps.exif_transpose(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        if img.size != target_size:
+            img = img.resize(target_size, resample)
+        return img
+
+
+def preprocess_into(path, out, target_size=TARGET_SIZE):
+    """Carga la imagen y la normaliza a [0, 1] directamente sobre `out` (alto, ancho, 3)"""
+    img = load_image(path, target_size)
+    out[...] = np.asarray(img)
+    out *= 1.0 / 255.0
+    return out
+
+
+def _keras_original(paths):
+    from tensorflow.keras.preprocessing import image
+
+    for path in paths:
+        img = image.load_img(path, target_size=TARGET_SIZE)
+        img_array = image.img_to_array(img) / 255.0
+        np.expand_dims(img_array, axis=0)
+
+
+_pool = None
+
+
+def _rapido(paths):
+    global _pool
+    if _pool is None or _pool.shape[0] < len(paths):
+        _pool = BatchBufferPool(1, len(paths))
+
+    with _pool.checkout() as buffer:
+        for i, path in enumerate(paths):
+            preprocess_into(path, buffer[i])
+
+
+def _medir(nombre, paths, repeat, cola):
+    # Se ejecuta en un proceso aparte para que la memoria pico (RSS) sea independiente
+    import resource
+    import sys
+    import time
+
+    if nombre == 'keras load_img':
+        from tensorflow.keras.preprocessing import image  # noqa: F401
+
+    # Línea base tras las importaciones y antes de decodificar cualquier imagen:
+    # ru_maxrss es una marca máxima, así que el pico incluye la primera decodificación
+    escala = 1 if sys.platform == 'darwin' else 1024
+    rss_inicial = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * escala
+
+    fn = {'preprocesamiento': _rapido, 'keras load_img': _keras_original}[nombre]
+    fn(paths[:1])
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(paths)
+    elapsed = time.perf_counter() - start
+
+    rss_pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * escala
+    cola.put((elapsed / (repeat * len(paths)) * 1000, (rss_pico - rss_inicial) / (1024 * 1024)))
+
+
+def benchmark(paths, repeat=5):
+    """Mide el tiempo por imagen y la memoria pico del preprocesamiento frente al de keras"""
+    import importlib.util
+    import multiprocessing
+
+    nombres = ['preprocesamiento']
+    if importlib.util.find_spec('tensorflow') is not None:
+        nombres.append('keras load_img')
+
+    ctx = multiprocessing.get_context('spawn')
+    resultados = {}
+    for nombre in nombres:
+        cola = ctx.Queue()
+        proceso = ctx.Process(target=_medir, args=(nombre, paths, repeat, cola))
+        proceso.start()
+        resultados[nombre] = cola.get()
+        proceso.join()
+
+    for nombre, (ms_por_imagen, pico_mb) in resultados.items():
+        print(f" {nombre:<18} {ms_por_imagen:8.2f} ms/imagen   pico +{pico_mb:8.2f} MB")
+
+    return resultados
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) < 2:
+        print("Uso: python preprocesamiento.py imagen1.jpg [imagen2.jpg ...]")
+        sys.exit(1)
+
+    benchmark(sys.argv[1:])